@@ -1,66 +1,212 @@
 """
 Database Connection Template
 Handles SQLite (development) and PostgreSQL (production)
+
+PgBouncer (optional):
+    Set USE_PGBOUNCER=1 and point DATABASE_URL at PgBouncer instead of Postgres.
+    SQLAlchemy's pool is disabled (NullPool) and PgBouncer does the pooling,
+    so many app replicas can share a small number of real Postgres connections.
+
+    Required pgbouncer.ini settings:
+        [pgbouncer]
+        pool_mode = transaction
+        max_client_conn = 1000
+        default_pool_size = 80
+
+    ⚠️ Transaction mode doesn't support server-side prepared statements.
+    asyncpg caches them by default, so the PgBouncer engine turns both
+    statement caches off (prepared_statement_cache_size / statement_cache_size).
+    That alone isn't enough: asyncpg still prepares every statement under a
+    per-connection name (__asyncpg_stmt_1__, ...), and those names collide on
+    server connections PgBouncer shares between clients. The engine gives
+    each statement a unique name (prepared_statement_name_func) instead.
+
+Async driver:
+    The engine is a SQLAlchemy 2.0 AsyncEngine. DATABASE_URL stays in the
+    usual form (postgresql://... or sqlite:///...) and is rewritten to
+    postgresql+asyncpg:// or sqlite+aiosqlite:// automatically.
+
+Lazy initialization:
+    Nothing connects to (or even configures) the database at import time.
+    get_engine() and get_session_factory() build everything on first use,
+    normally from the FastAPI lifespan handler:
+
+        app = FastAPI(lifespan=lifespan)
+
+    Tests can swap the database with app.dependency_overrides[get_db]
+    (set it before the app starts). lifespan then leaves the default engine
+    alone, so DATABASE_URL doesn't have to be set, and the diagnostic
+    endpoints use the engine behind the overriding session.
 """
 
+import asyncio
+import logging
 import os
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.pool import StaticPool
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from uuid import uuid4
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import QueuePool, StaticPool
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
 # ============================================================================
 # ENVIRONMENT SETUP
 # ============================================================================
 
-# ✅ CRITICAL: Only load .env if DATABASE_URL not already set by platform
-# Railway/Vercel inject environment variables - don't override them!
-if not os.getenv('DATABASE_URL'):
-    load_dotenv()
+def load_environment():
+    """Load .env for local development (no-op on platforms that set DATABASE_URL)."""
+    # ✅ CRITICAL: Only load .env if DATABASE_URL not already set by platform
+    # Railway/Vercel inject environment variables - don't override them!
+    if not os.getenv('DATABASE_URL'):
+        load_dotenv()
 
-DATABASE_URL = os.getenv('DATABASE_URL')
+@lru_cache(maxsize=1)
+def get_database_url() -> str:
+    """Read DATABASE_URL (loading .env if needed). Raises ValueError if unset."""
+    load_environment()
 
-if not DATABASE_URL:
-    raise ValueError(
-        "DATABASE_URL environment variable not set. "
-        "Set it in .env for local development or platform dashboard for production."
-    )
+    database_url = os.getenv('DATABASE_URL')
+
+    if not database_url:
+        raise ValueError(
+            "DATABASE_URL environment variable not set. "
+            "Set it in .env for local development or platform dashboard for production."
+        )
+    return database_url
 
 # ============================================================================
 # ENGINE CONFIGURATION
 # ============================================================================
 
-# SQLite configuration (development only)
-if DATABASE_URL.startswith('sqlite'):
-    print("⚠️  Using SQLite - FOR DEVELOPMENT ONLY!")
-    engine = create_engine(
-        DATABASE_URL,
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-        echo=False,  # Set to True to see SQL queries
-    )
+def _async_url(database_url: str) -> str:
+    """Rewrite a plain postgresql:// or sqlite:// URL to use an async driver."""
+    for prefix, async_prefix in (
+        ("postgresql://", "postgresql+asyncpg://"),
+        ("postgres://", "postgresql+asyncpg://"),  # Heroku/Railway style
+        ("sqlite://", "sqlite+aiosqlite://"),
+    ):
+        if database_url.startswith(prefix):
+            return async_prefix + database_url[len(prefix):]
+    return database_url  # Already has an explicit driver
+
+# libpq URL options asyncpg.connect() has no keyword argument for
+_LIBPQ_ONLY_PARAMS = (
+    "sslrootcert", "sslcert", "sslkey", "sslcrl", "sslpassword",
+    "channel_binding", "gssencmode",
+)
+
+def _asyncpg_url(database_url: str):
+    """
+    Move libpq-style query options out of an asyncpg URL.
 
-# PostgreSQL configuration (production)
-else:
-    print("✅ Using PostgreSQL - Production configuration")
-    engine = create_engine(
-        DATABASE_URL,
-        pool_size=5,  # Number of permanent connections
-        max_overflow=10,  # Number of additional connections when pool is full
-        pool_pre_ping=True,  # Verify connections before using
-        pool_recycle=3600,  # Recycle connections after 1 hour
+    SQLAlchemy passes URL query options to asyncpg.connect() as keyword
+    arguments, and asyncpg rejects libpq names such as ?sslmode=require.
+    sslmode becomes asyncpg's ssl argument and connect_timeout its timeout.
+
+    Returns (url, connect_args). Raises ValueError for libpq-only options
+    asyncpg has no equivalent for.
+    """
+    url = make_url(database_url)
+    if url.get_driver_name() != "asyncpg":
+        return url, {}
+
+    query = dict(url.query)
+    connect_args = {}
+    if "sslmode" in query:
+        connect_args["ssl"] = query.pop("sslmode")  # asyncpg accepts libpq sslmode values
+    if "connect_timeout" in query:
+        connect_args["timeout"] = float(query.pop("connect_timeout"))
+
+    unsupported = sorted(set(query) & set(_LIBPQ_ONLY_PARAMS))
+    if unsupported:
+        raise ValueError(
+            f"DATABASE_URL options not supported by asyncpg: {', '.join(unsupported)}. "
+            "Remove them from the URL (asyncpg reads certificate paths from "
+            "PGSSLROOTCERT / PGSSLCERT / PGSSLKEY instead)."
+        )
+    return url.set(query=query), connect_args
+
+@lru_cache(maxsize=1)
+def get_engine():
+    """Create the engine on first call; later calls return the same engine."""
+    database_url = _async_url(get_database_url())
+
+    # SQLite configuration (development only)
+    if database_url.startswith('sqlite'):
+        logger.warning("⚠️  Using SQLite - FOR DEVELOPMENT ONLY!")
+        return create_async_engine(
+            database_url,
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+            echo=False,  # Set to True to see SQL queries
+        )
+
+    url, connect_args = _asyncpg_url(database_url)
+
+    # PostgreSQL behind PgBouncer (transaction pooling)
+    if os.getenv("USE_PGBOUNCER") == "1":
+        from sqlalchemy.pool import NullPool
+
+        logger.info("✅ Using PostgreSQL via PgBouncer - pooling handled by PgBouncer")
+        return create_async_engine(
+            # No prepared statements - PgBouncer transaction mode can't track them
+            url.update_query_dict({"prepared_statement_cache_size": "0"}),
+            poolclass=NullPool,  # PgBouncer pools connections, not SQLAlchemy
+            connect_args={
+                **connect_args,
+                "statement_cache_size": 0,
+                # Unique names so statements from different clients don't collide
+                # (DuplicatePreparedStatementError) on a shared server connection
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+            },
+            pool_pre_ping=False,  # Every connection is fresh with NullPool
+            echo=False,  # Set to True to see SQL queries
+        )
+
+    # PostgreSQL configuration (production)
+    logger.info("✅ Using PostgreSQL - Production configuration")
+    return create_async_engine(
+        url,
+        connect_args=connect_args,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "20")),  # Number of permanent connections
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "30")),  # Additional connections when pool is full
+        pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),  # Seconds to wait for a free connection
+        # asyncpg has no client-side keepalive option, so a pooled connection
+        # the server or a proxy dropped is only noticed by a ping on checkout
+        pool_pre_ping=True,
+        pool_recycle=1800,  # Recycle after 30 min (below typical DB/proxy idle timeouts)
         echo=False,  # Set to True to see SQL queries
     )
 
+def get_db_scheme(bind=None) -> str:
+    """
+    Return "postgresql", "sqlite" or "unknown" from the engine's dialect.
+
+    Covers every URL spelling (postgres://, postgresql+asyncpg://, ...).
+    Pass a session's bind to check the engine that session actually uses.
+    """
+    name = (bind or get_engine()).dialect.name
+    return name if name in ("postgresql", "sqlite") else "unknown"
+
 # ============================================================================
 # SESSION CONFIGURATION
 # ============================================================================
 
-SessionLocal = sessionmaker(
-    autocommit=False,
-    autoflush=False,
-    bind=engine
-)
+@lru_cache(maxsize=1)
+def get_session_factory():
+    """Return the AsyncSession factory (created on first call)."""
+    return async_sessionmaker(
+        get_engine(),
+        class_=AsyncSession,
+        autoflush=False,
+        expire_on_commit=False,  # Objects stay usable after commit without a refresh query
+    )
 
 # Base class for SQLAlchemy models
 Base = declarative_base()
@@ -69,81 +215,234 @@ Base = declarative_base()
 # DEPENDENCY INJECTION
 # ============================================================================
 
-def get_db():
+async def get_db():
     """
-    FastAPI dependency that provides a database session.
+    FastAPI dependency that provides an async database session.
+
+    The session is closed when the request finishes, even if the handler raised.
 
     Usage:
         @app.get("/api/data")
-        async def get_data(db: Session = Depends(get_db)):
-            return db.query(MyModel).all()
+        async def get_data(db: AsyncSession = Depends(get_db)):
+            result = await db.execute(select(MyModel))
+            return result.scalars().all()
     """
-    db = SessionLocal()
-    try:
+    async with get_session_factory()() as db:
         yield db
-    finally:
-        db.close()
+
+# ============================================================================
+# APP LIFESPAN
+# ============================================================================
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    FastAPI lifespan: build the engine on startup, dispose it on shutdown.
+
+    Skipped when get_db is overridden (tests bring their own database).
+
+    Usage:
+        app = FastAPI(lifespan=lifespan)
+    """
+    if get_db in app.dependency_overrides:
+        yield
+        return
+
+    get_engine()
+    await check_connection()
+    yield
+    await get_engine().dispose()
+
+# ============================================================================
+# SQL STATEMENTS
+# ============================================================================
+
+# Built once at import instead of allocating a new TextClause per call.
+# Public names are shared with diagnostic_endpoints.
+_STMT_PING = text("SELECT 1")
+_STMT_SETVAL = text("SELECT setval(CAST(:seq AS regclass), :next_id, false)")
+STMT_SERIAL_SEQUENCE = text("SELECT pg_get_serial_sequence(:t, 'id')")
+
+# Identifiers can't be bound, so these are templates for whitelisted, quoted
+# names. The TextClause for each table is built once and reused.
+STMT_MAX_ID = "SELECT MAX(id) FROM {t}"
+
+@lru_cache(maxsize=256)
+def stmt_for_identifier(template: str, quoted_name: str):
+    """TextClause for a statement template and a quoted identifier."""
+    return text(template.format(t=quoted_name))
 
 # ============================================================================
 # DATABASE UTILITIES
 # ============================================================================
 
-def create_tables():
+async def create_tables():
     """Create all tables defined in models"""
-    Base.metadata.create_all(bind=engine)
-    print("✅ Database tables created")
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    logger.info("✅ Database tables created")
 
-def drop_tables():
+async def drop_tables():
     """Drop all tables (USE WITH CAUTION!)"""
-    Base.metadata.drop_all(bind=engine)
-    print("⚠️  All database tables dropped")
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    logger.warning("⚠️  All database tables dropped")
 
-def fix_sequence(table_name: str, db_session):
+async def fix_sequence(table_name: str, db_session: AsyncSession):
     """
     Fix PostgreSQL sequence after manual data insertion.
 
     Args:
         table_name: Name of the table
-        db_session: SQLAlchemy session
+        db_session: SQLAlchemy AsyncSession
 
     Usage:
-        with SessionLocal() as db:
-            fix_sequence('users', db)
+        async with get_session_factory()() as db:
+            await fix_sequence('users', db)
     """
-    if not DATABASE_URL.startswith('postgresql'):
-        print("⚠️  Sequence fix only needed for PostgreSQL")
+    if get_db_scheme(db_session.bind) != "postgresql":
+        logger.warning("⚠️  Sequence fix only needed for PostgreSQL")
+        return
+
+    # Table names can't be bound parameters - only allow tables that exist
+    conn = await db_session.connection()
+    tables = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names())
+    if table_name not in tables:
+        logger.error("❌ Unknown table: %s", table_name)
         return
+    quoted_table = db_session.bind.dialect.identifier_preparer.quote(table_name)
 
     try:
+        # setval(NULL, ...) silently does nothing - make sure there is a sequence
+        sequence_name = await db_session.scalar(STMT_SERIAL_SEQUENCE, {"t": quoted_table})
+        if sequence_name is None:
+            logger.error("❌ No id sequence for table %s", table_name)
+            return
+
         # Get max ID from table
-        max_id = db_session.execute(
-            text(f"SELECT MAX(id) FROM {table_name}")
-        ).scalar() or 0
+        max_id = (await db_session.execute(stmt_for_identifier(STMT_MAX_ID, quoted_table))).scalar() or 0
 
-        # Reset sequence to max_id + 1
-        db_session.execute(
-            text(f"ALTER SEQUENCE {table_name}_id_seq RESTART WITH {max_id + 1}")
+        # Reset sequence to max_id + 1 (setval is fully parameterized)
+        await db_session.execute(
+            _STMT_SETVAL,
+            {"seq": sequence_name, "next_id": max_id + 1},
         )
-        db_session.commit()
+        await db_session.commit()
 
-        print(f"✅ Fixed sequence for {table_name} (restarted at {max_id + 1})")
+        logger.info("✅ Fixed sequence for %s (restarted at %d)", table_name, max_id + 1)
     except Exception as e:
-        print(f"❌ Error fixing sequence for {table_name}: {e}")
-        db_session.rollback()
+        logger.error("❌ Error fixing sequence for %s: %s", table_name, e)
+        await db_session.rollback()
+
+# ============================================================================
+# HEALTH PROBE CACHE
+# ============================================================================
+
+# Load balancers and dashboards poll health endpoints constantly.
+# Cache the SELECT 1 result so only one real round trip happens per TTL window.
+_HEALTH_CACHE = {
+    "engine": None, "ts": 0.0, "ok": False, "error": None,
+    "loop": None, "lock": None,  # Lock for the running event loop (see _health_lock)
+}
+
+@lru_cache(maxsize=1)
+def _health_ttl() -> float:
+    """HEALTH_TTL_SECONDS, read on first use so .env has been loaded."""
+    return float(os.getenv("HEALTH_TTL_SECONDS", "5"))
+
+def _health_lock() -> asyncio.Lock:
+    """
+    Ping lock for the running event loop.
 
-def check_connection():
+    An asyncio.Lock is bound to one loop, and every TestClient block or
+    pytest-asyncio test runs its own, so the lock is recreated per loop.
+    """
+    loop = asyncio.get_running_loop()
+    if _HEALTH_CACHE["loop"] is not loop:
+        _HEALTH_CACHE["loop"] = loop
+        _HEALTH_CACHE["lock"] = asyncio.Lock()
+    return _HEALTH_CACHE["lock"]
+
+def _health_cached(engine) -> bool:
+    """True if the cached ping result is for this engine and still fresh."""
+    return (
+        _HEALTH_CACHE["engine"] is engine
+        and time.monotonic() - _HEALTH_CACHE["ts"] < _health_ttl()
+    )
+
+def pool_stats(engine=None):
+    """
+    Connection pool counters, read from memory (no query).
+
+    Returns None for pools without counters (SQLite StaticPool, PgBouncer NullPool).
+    """
+    pool = (engine or get_engine()).pool
+    if not isinstance(pool, QueuePool):
+        return None
+
+    # QueuePool only exposes max_overflow as a private attribute, and the
+    # saturation check needs it: checkedout() alone can't say if the pool is full
+    max_overflow = pool._max_overflow
+    return {
+        "pool_size": pool.size(),
+        "max_overflow": max_overflow,
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        # max_overflow=-1 means unlimited overflow, so the pool never saturates
+        "saturated": max_overflow != -1 and pool.checkedout() >= pool.size() + max_overflow,
+    }
+
+async def cached_db_ping(engine=None):
+    """
+    Run SELECT 1 at most once per HEALTH_TTL_SECONDS (default 5s).
+
+    Returns (ok, error) where error is None on success.
+    Concurrent callers wait on a lock instead of all hitting the database.
+    Fails fast (no query) when every pooled connection is checked out.
+    Pings get_engine() unless another engine is passed.
+    """
+    engine = engine or get_engine()
+
+    # A saturated pool would make SELECT 1 wait for pool_timeout - report it now
+    stats = pool_stats(engine)
+    if stats and stats["saturated"]:
+        return False, "Connection pool exhausted"
+
+    if _health_cached(engine):
+        return _HEALTH_CACHE["ok"], _HEALTH_CACHE["error"]
+
+    async with _health_lock():
+        # Another request may have refreshed the cache while we waited
+        if _health_cached(engine):
+            return _HEALTH_CACHE["ok"], _HEALTH_CACHE["error"]
+
+        try:
+            async with engine.connect() as conn:
+                await conn.execute(_STMT_PING)
+            ok, error = True, None
+        except Exception as e:
+            ok, error = False, str(e)
+
+        _HEALTH_CACHE["engine"] = engine
+        _HEALTH_CACHE["ok"] = ok
+        _HEALTH_CACHE["error"] = error
+        _HEALTH_CACHE["ts"] = time.monotonic()
+        return ok, error
+
+async def check_connection():
     """
     Check if database connection is working.
     Returns True if connected, False otherwise.
+
+    Result is cached for HEALTH_TTL_SECONDS (see cached_db_ping).
     """
-    try:
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
-        print("✅ Database connection successful")
-        return True
-    except Exception as e:
-        print(f"❌ Database connection failed: {e}")
-        return False
+    ok, error = await cached_db_ping()
+    if ok:
+        logger.info("✅ Database connection successful")
+    else:
+        logger.error("❌ Database connection failed: %s", error)
+    return ok
 
 # ============================================================================
 # INITIALIZATION
@@ -151,5 +450,6 @@ def check_connection():
 
 # Verify connection on import
 if __name__ == "__main__":
-    check_connection()
-    print(f"Database URL: {DATABASE_URL[:30]}...")  # Don't print full URL
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    asyncio.run(check_connection())
+    logger.info("Database URL: %s...", get_database_url()[:30])  # Don't log full URL
@@ -3,77 +3,270 @@ Diagnostic Endpoints Template
 Essential endpoints for debugging production issues
 """
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import text, inspect
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import JSON, BigInteger, Integer, text, inspect
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
 from datetime import datetime
+from functools import lru_cache
+from typing import Annotated
+import asyncio
 import os
+import sys
+import time
 
-from database.connection import get_db, engine
+import orjson
 
-router = APIRouter()
+from database.connection import (
+    get_db, get_db_scheme, cached_db_ping, load_environment, pool_stats,
+    STMT_MAX_ID, STMT_SERIAL_SEQUENCE, stmt_for_identifier,
+)
+
+# orjson encodes 3-5x faster than stdlib json
+router = APIRouter(default_response_class=ORJSONResponse)
+
+# Reusable dependency type for handlers that need a database session
+DBSession = Annotated[AsyncSession, Depends(get_db)]
+
+def _engine(db: AsyncSession):
+    """The AsyncEngine behind a session (an overridden get_db may bind a connection)."""
+    bind = db.bind
+    return bind.engine if isinstance(bind, AsyncConnection) else bind
+
+# ============================================================================
+# SQL STATEMENTS
+# ============================================================================
+
+# Templates for whitelisted, quoted identifiers - build them with stmt_for_identifier()
+_STMT_COUNT = "SELECT COUNT(*) FROM {t}"
+_STMT_LAST_VALUE = "SELECT last_value FROM {t}"
+
+# [second, isoformat string] - the string is rebuilt at most once per second
+_ts_cache = [0, ""]
+
+def _now_iso() -> str:
+    """Current UTC time as an ISO string, cached to one-second precision."""
+    t = int(time.time())
+    c = _ts_cache
+    if c[0] != t:
+        c[0] = t
+        c[1] = datetime.utcfromtimestamp(t).isoformat()
+    return c[1]
+
+def request_timestamp() -> str:
+    """Request-scoped timestamp, computed once per request."""
+    return _now_iso()
+
+# ============================================================================
+# ENVIRONMENT SNAPSHOT
+# ============================================================================
+
+# Env vars can't change from outside a running process, so read them once
+# (on first request, not at import) instead of on every request.
+# Restart the app to pick up new values.
+_ENV_VARS = {
+    # Core
+    "database_url_set": "DATABASE_URL",
+    "environment_set": "ENVIRONMENT",
+    "log_level_set": "LOG_LEVEL",
+
+    # API Keys (check without exposing!)
+    "finnhub_api_key_set": "FINNHUB_API_KEY",
+    "alpha_vantage_api_key_set": "ALPHA_VANTAGE_API_KEY",
+
+    # Optional services
+    "redis_url_set": "REDIS_URL",
+    "sentry_dsn_set": "SENTRY_DSN",
+}
+
+APP_VERSION = "1.0.0"  # Update this with each release
+
+@lru_cache(maxsize=1)
+def _env_snapshot() -> dict:
+    """Environment name and which variables are set, read on first use."""
+    load_environment()  # Pick up .env in local development
+    return {
+        "environment": os.getenv('ENVIRONMENT', 'unknown'),
+        "variables": {key: bool(os.getenv(var)) for key, var in _ENV_VARS.items()},
+    }
+
+@lru_cache(maxsize=4)
+def _version_payload_static(db_scheme: str) -> bytes:
+    """/version body without the timestamp, encoded once per database type."""
+    return orjson.dumps({
+        "app_version": APP_VERSION,
+        "python_version": f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}",
+        "database_type": {"postgresql": "PostgreSQL", "sqlite": "SQLite"}.get(db_scheme, "Unknown"),
+        "environment": _env_snapshot()["environment"],
+    })
 
 # ============================================================================
 # HEALTH CHECK
 # ============================================================================
 
+@router.get("/healthz", status_code=204, response_class=Response)
+async def liveness_probe():
+    """
+    Load balancer health check.
+    Returns 204 with an empty body if service is running.
+
+    ✅ Point load balancers, Docker HEALTHCHECK and k8s probes HERE.
+    No database, no JSON encoding, no timestamp - just a status code.
+    """
+    return Response(status_code=204)
+
 @router.get("/health")
-async def health_check():
+async def health_check(now: str = Depends(request_timestamp)):
     """
     Basic health check endpoint.
     Returns 200 if service is running.
 
+    Human-readable version of /healthz. Never touches the database.
+
     Use for:
-    - Load balancer health checks
     - Uptime monitoring
-    - Quick service status
+    - Quick service status from a browser or curl
     """
     return {
         "status": "healthy",
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": now,
         "service": "your-app-name"
     }
 
+# ============================================================================
+# SCHEMA CACHE
+# ============================================================================
+
+# Every inspector call runs several catalog queries (pg_class, pg_attribute,
+# pg_index). Schema changes are rare, so cache results per time bucket.
+# Call POST /admin/cache/invalidate after running migrations.
+@lru_cache(maxsize=1)
+def _schema_cache_ttl() -> int:
+    """SCHEMA_CACHE_TTL_SECONDS, read on first use so .env has been loaded."""
+    return int(os.getenv("SCHEMA_CACHE_TTL_SECONDS", "60"))
+
+# Inspector results for the current time bucket, keyed by
+# (engine, method, table_name). The whole dict is dropped when the bucket changes.
+_SCHEMA_CACHE = {"bucket": None, "data": {}}
+
+def _bucket() -> int:
+    """Current cache bucket - changes every SCHEMA_CACHE_TTL_SECONDS."""
+    return int(time.monotonic() // _schema_cache_ttl())
+
+async def _inspect(engine, method: str, *args):
+    """Run an Inspector method (e.g. "get_columns") once per cache bucket."""
+    bucket = _bucket()
+    if _SCHEMA_CACHE["bucket"] != bucket:
+        _SCHEMA_CACHE["bucket"] = bucket
+        _SCHEMA_CACHE["data"] = {}
+
+    key = (engine, method, *args)
+    data = _SCHEMA_CACHE["data"]
+    if key not in data:
+        # Inspector is sync-only - run it on the async connection via run_sync
+        async with engine.connect() as conn:
+            data[key] = await conn.run_sync(
+                lambda sync_conn: getattr(inspect(sync_conn), method)(*args)
+            )
+    return data[key]
+
+async def _tables(engine):
+    """Sorted table names (cached)."""
+    return sorted(await _inspect(engine, "get_table_names"))
+
+async def _columns(engine, table_name: str):
+    """Column details for a table (cached)."""
+    return await _inspect(engine, "get_columns", table_name)
+
+async def _indexes(engine, table_name: str):
+    """Index details for a table (cached)."""
+    return await _inspect(engine, "get_indexes", table_name)
+
+def invalidate_schema_cache():
+    """Drop all cached schema data (e.g. after a migration)."""
+    _SCHEMA_CACHE["bucket"] = None
+    _SCHEMA_CACHE["data"] = {}
+
+@router.post("/admin/cache/invalidate")
+async def invalidate_cache(now: str = Depends(request_timestamp)):
+    """
+    Clear the cached table/column/index lists.
+
+    ⚠️ Protect this route (auth or internal network only) in production.
+
+    Use for:
+    - Right after running migrations
+    - Debugging "table not found" right after creating a table
+    """
+    invalidate_schema_cache()
+    return {
+        "invalidated": True,
+        "timestamp": now
+    }
+
 # ============================================================================
 # DATABASE CHECK
 # ============================================================================
 
 @router.get("/db-check")
-async def database_check(db: Session = Depends(get_db)):
+async def database_check(
+    response: Response,
+    db: DBSession,
+    now: str = Depends(request_timestamp),
+):
     """
     Check database connectivity and list tables.
 
+    ⚠️ On-demand only - do NOT use as a load balancer probe (use /healthz).
+    The table list is cached for SCHEMA_CACHE_TTL_SECONDS (default 60s).
+
+    Returns 503 when the database is unreachable, so caches and probes
+    never treat a failed check as a good one.
+
     Returns:
     - connected: bool
     - tables: list of table names
     - table_count: number of tables
+    - pool_stats: connection pool counters (null for SQLite/PgBouncer)
 
     Use for:
     - Verifying database migrations
     - Checking database connectivity
     - Debugging missing tables
     """
+    engine = _engine(db)
+    database_url_set = _env_snapshot()["variables"]["database_url_set"]
+    stats = None
     try:
-        # Test connection
-        db.execute(text("SELECT 1"))
+        # Pool counters are in-memory - read them before touching the database
+        stats = pool_stats(engine)
 
-        # Get table names
-        inspector = inspect(engine)
-        tables = inspector.get_table_names()
+        # A cold schema cache would wait for pool_timeout on a saturated pool
+        if stats and stats["saturated"]:
+            raise RuntimeError("Connection pool exhausted")
 
+        # Test connection and list tables concurrently (both cached)
+        (ok, error), tables = await asyncio.gather(cached_db_ping(engine), _tables(engine))
+        if not ok:
+            raise RuntimeError(error)
+
+        response.headers["Cache-Control"] = "max-age=10"
         return {
             "connected": True,
-            "database_url_set": bool(os.getenv('DATABASE_URL')),
+            "database_url_set": database_url_set,
             "table_count": len(tables),
-            "tables": sorted(tables),
-            "timestamp": datetime.utcnow().isoformat()
+            "tables": tables,
+            "pool_stats": stats,
+            "timestamp": now
         }
     except Exception as e:
+        response.status_code = 503
         return {
             "connected": False,
             "error": str(e),
-            "database_url_set": bool(os.getenv('DATABASE_URL')),
-            "timestamp": datetime.utcnow().isoformat()
+            "database_url_set": database_url_set,
+            "pool_stats": stats,
+            "timestamp": now
         }
 
 # ============================================================================
@@ -81,7 +274,7 @@ async def database_check(db: Session = Depends(get_db)):
 # ============================================================================
 
 @router.get("/env-check")
-async def environment_check():
+async def environment_check(now: str = Depends(request_timestamp)):
     """
     Check which environment variables are set.
 
@@ -96,31 +289,125 @@ async def environment_check():
     - Verifying deployment configuration
     - Checking which services are configured
     """
+    env = _env_snapshot()
     return {
-        "environment": os.getenv('ENVIRONMENT', 'unknown'),
-        "variables": {
-            # Core
-            "database_url_set": bool(os.getenv('DATABASE_URL')),
-            "environment_set": bool(os.getenv('ENVIRONMENT')),
-            "log_level_set": bool(os.getenv('LOG_LEVEL')),
-
-            # API Keys (check without exposing!)
-            "finnhub_api_key_set": bool(os.getenv('FINNHUB_API_KEY')),
-            "alpha_vantage_api_key_set": bool(os.getenv('ALPHA_VANTAGE_API_KEY')),
-
-            # Optional services
-            "redis_url_set": bool(os.getenv('REDIS_URL')),
-            "sentry_dsn_set": bool(os.getenv('SENTRY_DSN')),
-        },
-        "timestamp": datetime.utcnow().isoformat()
+        "environment": env["environment"],
+        "variables": env["variables"],
+        "timestamp": now
     }
 
+# ============================================================================
+# TABLE NAME VALIDATION
+# ============================================================================
+
+async def _safe_ident(engine, name: str) -> str:
+    """
+    Return the quoted identifier for an existing table.
+
+    Table names can't be bound as SQL parameters, so only names that appear
+    in the (cached) table list are ever interpolated into SQL.
+    Raises HTTPException(400) for anything else.
+    """
+    if name not in await _tables(engine):
+        raise HTTPException(status_code=400, detail=f"Unknown table '{name}'")
+    return engine.dialect.identifier_preparer.quote(name)
+
 # ============================================================================
 # TABLE INFO
 # ============================================================================
 
+# PostgreSQL: columns, indexes and estimated row count in ONE round trip.
+# Reads pg_catalog directly; the primary key index is skipped to match
+# Inspector.get_indexes().
+_PG_TABLE_INFO = text("""
+    WITH tbl AS (
+        SELECT c.oid, c.reltuples::bigint AS row_count, c.relpages
+        FROM pg_class c
+        WHERE c.relname = :t AND c.relkind IN ('r', 'p') AND pg_table_is_visible(c.oid)
+    ),
+    cols AS (
+        SELECT json_agg(json_build_object(
+            'name', a.attname,
+            'type', format_type(a.atttypid, a.atttypmod),
+            'nullable', NOT a.attnotnull,
+            'default', pg_get_expr(d.adbin, d.adrelid)
+        ) ORDER BY a.attnum) AS columns
+        FROM tbl
+        JOIN pg_attribute a ON a.attrelid = tbl.oid AND a.attnum > 0 AND NOT a.attisdropped
+        LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+    ),
+    idx AS (
+        SELECT json_agg(json_build_object(
+            'name', ic.relname,
+            'columns', (
+                SELECT json_agg(ia.attname ORDER BY k.ord)
+                FROM unnest(i.indkey) WITH ORDINALITY AS k(attnum, ord)
+                JOIN pg_attribute ia ON ia.attrelid = i.indrelid AND ia.attnum = k.attnum
+            ),
+            'unique', i.indisunique
+        ) ORDER BY ic.relname) AS indexes
+        FROM tbl
+        JOIN pg_index i ON i.indrelid = tbl.oid AND NOT i.indisprimary
+        JOIN pg_class ic ON ic.oid = i.indexrelid
+    )
+    SELECT
+        (SELECT columns FROM cols) AS columns,
+        (SELECT indexes FROM idx) AS indexes,
+        (SELECT row_count FROM tbl) AS row_count,
+        (SELECT relpages FROM tbl) AS relpages
+""").columns(columns=JSON, indexes=JSON, row_count=BigInteger, relpages=Integer)
+
+async def _exact_row_count(db: AsyncSession, table_name: str) -> int:
+    """COUNT(*) - a full scan, so only used on SQLite or never-analyzed tables."""
+    # Identifiers can't be bound; table_name was checked against the table list
+    quoted = db.bind.dialect.identifier_preparer.quote(table_name)
+    return await db.scalar(stmt_for_identifier(_STMT_COUNT, quoted))
+
+async def _pg_table_info(db: AsyncSession, table_name: str):
+    """Return (columns, indexes, row_count, is_estimate) using one catalog query."""
+    row = (await db.execute(_PG_TABLE_INFO, {"t": table_name})).one()
+    row_count, is_estimate = row.row_count, True
+
+    # Never analyzed: reltuples is -1 on PostgreSQL 14+ but 0 on 13 and older,
+    # where relpages = 0 is the only sign the estimate means nothing
+    if row_count is None or row_count < 0 or not row.relpages:
+        row_count, is_estimate = await _exact_row_count(db, table_name), False
+
+    return row.columns or [], row.indexes or [], row_count, is_estimate
+
+async def _inspector_table_info(db: AsyncSession, table_name: str):
+    """Return (columns, indexes, row_count, is_estimate) via the cached Inspector."""
+    engine = _engine(db)
+    columns, indexes, row_count = await asyncio.gather(
+        _columns(engine, table_name),
+        _indexes(engine, table_name),
+        _exact_row_count(db, table_name),
+    )
+    columns = [
+        {
+            "name": col["name"],
+            "type": str(col["type"]),
+            "nullable": col["nullable"],
+            "default": str(col["default"]) if col["default"] else None
+        }
+        for col in columns
+    ]
+    indexes = [
+        {
+            "name": idx["name"],
+            "columns": idx["column_names"],
+            "unique": idx["unique"]
+        }
+        for idx in indexes
+    ]
+    return columns, indexes, row_count, False
+
 @router.get("/table-info/{table_name}")
-async def table_info(table_name: str, db: Session = Depends(get_db)):
+async def table_info(
+    table_name: str,
+    db: DBSession,
+    now: str = Depends(request_timestamp),
+):
     """
     Get detailed information about a specific table.
 
@@ -129,7 +416,8 @@ async def table_info(table_name: str, db: Session = Depends(get_db)):
 
     Returns:
     - columns: list of column details
-    - row_count: number of rows
+    - row_count: number of rows (estimated on PostgreSQL)
+    - row_count_estimate: True if row_count comes from planner statistics
     - indexes: list of indexes
 
     Use for:
@@ -138,45 +426,23 @@ async def table_info(table_name: str, db: Session = Depends(get_db)):
     - Checking data population
     """
     try:
-        inspector = inspect(engine)
-
-        # Check if table exists
-        tables = inspector.get_table_names()
-        if table_name not in tables:
+        # Check if table exists (cached)
+        if table_name not in await _tables(_engine(db)):
             raise HTTPException(status_code=404, detail=f"Table '{table_name}' not found")
 
-        # Get column information
-        columns = inspector.get_columns(table_name)
-
-        # Get row count
-        result = db.execute(text(f"SELECT COUNT(*) FROM {table_name}"))
-        row_count = result.scalar()
-
-        # Get indexes
-        indexes = inspector.get_indexes(table_name)
+        if get_db_scheme(db.bind) == "postgresql":
+            columns, indexes, row_count, row_count_estimate = await _pg_table_info(db, table_name)
+        else:
+            columns, indexes, row_count, row_count_estimate = await _inspector_table_info(db, table_name)
 
         return {
             "table_name": table_name,
             "row_count": row_count,
+            "row_count_estimate": row_count_estimate,
             "column_count": len(columns),
-            "columns": [
-                {
-                    "name": col["name"],
-                    "type": str(col["type"]),
-                    "nullable": col["nullable"],
-                    "default": str(col["default"]) if col["default"] else None
-                }
-                for col in columns
-            ],
-            "indexes": [
-                {
-                    "name": idx["name"],
-                    "columns": idx["column_names"],
-                    "unique": idx["unique"]
-                }
-                for idx in indexes
-            ],
-            "timestamp": datetime.utcnow().isoformat()
+            "columns": columns,
+            "indexes": indexes,
+            "timestamp": now
         }
     except HTTPException:
         raise
@@ -188,7 +454,11 @@ async def table_info(table_name: str, db: Session = Depends(get_db)):
 # ============================================================================
 
 @router.get("/sequence-check/{table_name}")
-async def sequence_check(table_name: str, db: Session = Depends(get_db)):
+async def sequence_check(
+    table_name: str,
+    db: DBSession,
+    now: str = Depends(request_timestamp),
+):
     """
     Check PostgreSQL sequence status for a table.
 
@@ -205,23 +475,29 @@ async def sequence_check(table_name: str, db: Session = Depends(get_db)):
     - Verifying data imports
     - Checking sequence health after manual operations
     """
-    database_url = os.getenv('DATABASE_URL', '')
-
-    if not database_url.startswith('postgresql'):
+    db_scheme = get_db_scheme(db.bind)
+    if db_scheme != "postgresql":
         return {
             "error": "Sequence check only applicable to PostgreSQL",
-            "database_type": "sqlite" if database_url.startswith('sqlite') else "unknown"
+            "database_type": db_scheme
         }
 
+    # Whitelist the table name before it goes anywhere near SQL
+    quoted_table = await _safe_ident(_engine(db), table_name)
+
     try:
         # Get max ID from table
-        max_id_result = db.execute(text(f"SELECT MAX(id) FROM {table_name}"))
-        max_id = max_id_result.scalar() or 0
+        max_id = await db.scalar(stmt_for_identifier(STMT_MAX_ID, quoted_table)) or 0
 
-        # Get next sequence value
-        sequence_name = f"{table_name}_id_seq"
-        next_val_result = db.execute(text(f"SELECT last_value FROM {sequence_name}"))
-        next_val = next_val_result.scalar()
+        # Look up the sequence behind the id column (bound parameter, not f-string)
+        sequence_name = await db.scalar(
+            STMT_SERIAL_SEQUENCE, {"t": quoted_table}
+        )
+        if sequence_name is None:
+            raise HTTPException(status_code=404, detail=f"No id sequence for table '{table_name}'")
+
+        # Get next sequence value (sequence_name comes from the catalog, already quoted)
+        next_val = await db.scalar(stmt_for_identifier(_STMT_LAST_VALUE, sequence_name))
 
         # Check if in sync
         in_sync = next_val > max_id
@@ -233,8 +509,10 @@ async def sequence_check(table_name: str, db: Session = Depends(get_db)):
             "in_sync": in_sync,
             "needs_fix": not in_sync,
             "fix_command": f"ALTER SEQUENCE {sequence_name} RESTART WITH {max_id + 1};" if not in_sync else None,
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": now
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error checking sequence: {str(e)}")
 
@@ -242,8 +520,8 @@ async def sequence_check(table_name: str, db: Session = Depends(get_db)):
 # VERSION INFO
 # ============================================================================
 
-@router.get("/version")
-async def version_info():
+@router.get("/version", response_class=Response)
+async def version_info(db: DBSession, now: str = Depends(request_timestamp)):
     """
     Return version information about the application.
 
@@ -257,24 +535,12 @@ async def version_info():
     - Debugging version-specific issues
     - Checking infrastructure details
     """
-    import sys
-
-    database_url = os.getenv('DATABASE_URL', '')
-
-    if database_url.startswith('postgresql'):
-        db_type = "PostgreSQL"
-    elif database_url.startswith('sqlite'):
-        db_type = "SQLite"
-    else:
-        db_type = "Unknown"
-
-    return {
-        "app_version": "1.0.0",  # Update this with each release
-        "python_version": f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}",
-        "database_type": db_type,
-        "environment": os.getenv('ENVIRONMENT', 'unknown'),
-        "timestamp": datetime.utcnow().isoformat()
-    }
+    # Everything but the timestamp is encoded once per process - splice it in
+    body = (
+        _version_payload_static(get_db_scheme(db.bind))[:-1]
+        + b',"timestamp":"' + now.encode() + b'"}'
+    )
+    return Response(content=body, media_type="application/json")
 
 # ============================================================================
 # USAGE IN MAIN APP
@@ -283,19 +549,37 @@ async def version_info():
 """
 Add to your main FastAPI app:
 
+import logging
+import os
+
 from fastapi import FastAPI
+from database.connection import lifespan
 from diagnostic_endpoints import router as diagnostic_router
 
-app = FastAPI()
+# Configure logging once, before the app starts
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+
+# Optional: JSON access logs (pip install python-json-logger)
+# from pythonjsonlogger import jsonlogger
+# json_handler = logging.StreamHandler()
+# json_handler.setFormatter(jsonlogger.JsonFormatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+# logging.getLogger("uvicorn.access").handlers = [json_handler]
+
+# lifespan creates the database engine on startup and disposes it on shutdown
+# Optional: use orjson for every route, not just diagnostics
+# app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+app = FastAPI(lifespan=lifespan)
 
 # Include diagnostic endpoints
 app.include_router(diagnostic_router, tags=["diagnostics"])
 
 # Now you can access:
+# GET /healthz  (load balancer probe)
 # GET /health
 # GET /db-check
 # GET /env-check
 # GET /table-info/{table_name}
 # GET /sequence-check/{table_name}
 # GET /version
+# POST /admin/cache/invalidate
 """
@@ -0,0 +1,205 @@
+"""
+Response Cache Middleware Template
+Caches full HTTP responses for diagnostic endpoints in Redis
+
+Each cached entry stores status code, headers, body and timestamps in a
+Redis hash keyed by SHA-1 of (path, query string). TTL adapts to how long
+the handler took, clamped to the route's policy:
+
+    ttl = clamp(generation_time * 2 + policy_min, policy_min, policy_max)
+
+Redis is optional: if the redis package isn't installed or REDIS_URL isn't
+set, the middleware passes every request straight through.
+
+Stale fallback (off by default, CACHE_FALLBACK_ENABLED=1):
+    Every 200 response is also saved under a stale key with no expiry.
+    If the handler raises or returns 5xx (e.g. the database is failing
+    over), the last good response is served with X-Cache: stale and
+    HTTP 200, so readiness probes don't pull every replica at once.
+    Handlers must report failures with a 5xx status (/db-check returns 503
+    when the database is down) or they would overwrite the good copy.
+
+💡 Configure Redis with an LFU eviction policy so hot endpoints stay cached:
+    maxmemory-policy allkeys-lfu
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import Response
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # Redis is optional - middleware becomes a no-op
+    redis = None
+
+# ============================================================================
+# CACHE POLICIES
+# ============================================================================
+
+# Policy name -> (min TTL, max TTL) in seconds
+TTL_POLICIES = {
+    "short": (1, 10),
+    "normal": (10, 30),
+    "long": (30, 60),
+}
+
+# Route prefix -> policy name. Routes not listed here are never cached.
+CACHE_POLICIES = {
+    "/health": "short",
+    "/db-check": "normal",
+    "/table-info": "normal",
+    "/sequence-check": "normal",
+    "/env-check": "long",
+    "/version": "long",
+}
+
+# Redis is best-effort: give up quickly instead of waiting for the OS TCP
+# timeout when it is unreachable (redis-py has no timeouts by default)
+REDIS_SOCKET_TIMEOUT_SECONDS = 0.25
+
+# ============================================================================
+# MIDDLEWARE
+# ============================================================================
+
+class ResponseCacheMiddleware(BaseHTTPMiddleware):
+    """
+    Serve GET responses for configured routes from Redis.
+
+    Adds an X-Cache header (HIT, MISS or stale) to cached routes.
+    Redis errors never fail a request - the handler just runs normally.
+
+    Usage:
+        app = FastAPI()
+        app.add_middleware(ResponseCacheMiddleware, policies=CACHE_POLICIES)
+    """
+
+    def __init__(self, app, policies=None, redis_url=None, key_prefix="respcache:",
+                 fallback_enabled=None):
+        super().__init__(app)
+        self.policies = CACHE_POLICIES if policies is None else policies
+        self.key_prefix = key_prefix
+
+        if fallback_enabled is None:
+            fallback_enabled = os.getenv("CACHE_FALLBACK_ENABLED") == "1"
+        self.fallback_enabled = fallback_enabled
+
+        redis_url = redis_url or os.getenv("REDIS_URL")
+        self.redis = redis.from_url(
+            redis_url,
+            socket_connect_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+            socket_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+        ) if redis and redis_url else None
+
+    def _ttl_bounds(self, path: str):
+        """Return (min_ttl, max_ttl) for a path, or None if it isn't cached."""
+        for prefix, policy in self.policies.items():
+            if path == prefix or path.startswith(prefix + "/"):
+                return TTL_POLICIES[policy]
+        return None
+
+    def _cache_key(self, request) -> str:
+        raw = f"{request.url.path}?{request.url.query}".encode()
+        return self.key_prefix + hashlib.sha1(raw).hexdigest()
+
+    async def dispatch(self, request, call_next):
+        bounds = self._ttl_bounds(request.url.path)
+        if self.redis is None or bounds is None or request.method != "GET":
+            return await call_next(request)
+
+        key = self._cache_key(request)
+
+        # Cache hit - rebuild the response without calling the handler
+        try:
+            cached = await self.redis.hgetall(key)
+        except Exception:
+            cached = None
+        if cached:
+            return _build_response(cached, "HIT")
+
+        # Cache miss - run the handler and time it
+        start = time.perf_counter()
+        try:
+            response = await call_next(request)
+        except Exception:
+            stale = await self._stale_response(key)
+            if stale is None:
+                raise
+            return stale
+        generation_time = time.perf_counter() - start
+
+        if response.status_code >= 500:
+            stale = await self._stale_response(key)
+            return response if stale is None else stale
+
+        if response.status_code != 200:
+            return response
+
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        headers = dict(response.headers)
+
+        min_ttl, max_ttl = bounds
+        ttl = min(max(generation_time * 2 + min_ttl, min_ttl), max_ttl)
+
+        entry = {
+            "status": response.status_code,
+            "headers": json.dumps(headers),
+            "body": body,
+            "created_at": time.time(),
+            "generation_time": generation_time,
+        }
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(key, mapping=entry)
+                pipe.pexpire(key, int(ttl * 1000))
+                if self.fallback_enabled:
+                    # Last known good copy - never expires
+                    pipe.hset(self._stale_key(key), mapping=entry)
+                await pipe.execute()
+        except Exception:
+            pass  # Caching is best-effort
+
+        headers["X-Cache"] = "MISS"
+        return Response(content=body, status_code=response.status_code, headers=headers)
+
+    def _stale_key(self, key: str) -> str:
+        return key.replace(self.key_prefix, self.key_prefix + "stale:", 1)
+
+    async def _stale_response(self, key: str):
+        """Last known good response, or None if disabled/missing."""
+        if not self.fallback_enabled:
+            return None
+        try:
+            cached = await self.redis.hgetall(self._stale_key(key))
+        except Exception:
+            return None
+        if not cached:
+            return None
+        return _build_response(cached, "stale", status_code=200)
+
+def _build_response(cached: dict, cache_status: str, status_code=None) -> Response:
+    """Rebuild a Response from a Redis hash (bytes keys and values)."""
+    headers = json.loads(cached[b"headers"])
+    headers["X-Cache"] = cache_status
+    return Response(
+        content=cached[b"body"],
+        status_code=status_code or int(cached[b"status"]),
+        headers=headers,
+    )
+
+# ============================================================================
+# USAGE IN MAIN APP
+# ============================================================================
+
+"""
+Add to your main FastAPI app (requires redis in requirements.txt and REDIS_URL):
+
+from fastapi import FastAPI
+from middleware.response_cache import ResponseCacheMiddleware, CACHE_POLICIES
+
+app = FastAPI()
+app.add_middleware(ResponseCacheMiddleware, policies=CACHE_POLICIES)
+"""